@@ -0,0 +1,98 @@
+from fastapi import HTTPException, Request
+from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+import database
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def parse_fields(fields, schema):
+    """Validate a comma-separated field projection against a response schema"""
+    allowed = list(schema.model_fields)
+    if not fields:
+        return allowed
+
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+        )
+    return requested
+
+def name_prefix_filter(column, q):
+    """Case-insensitive prefix match that can use the column's NOCASE index"""
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.collate("NOCASE").like(f"{escaped}%", escape="\\")
+
+def fetch_page(db: Session, model, schema, filters, cursor, limit, fields):
+    """Fetch one page of rows ordered by id, selecting only the projected columns.
+
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    selected = parse_fields(fields, schema)
+    columns = [model.id] + [getattr(model, f) for f in selected if f != "id"]
+
+    query = db.query(*columns).filter(*filters)
+    if cursor is not None:
+        query = query.filter(model.id > cursor)
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        data = row._asdict()
+        items.append({f: data[f] for f in selected})
+
+    next_cursor = rows[-1].id if has_more else None
+    return items, next_cursor
+
+def cache_headers(db: Session, request: Request, resource: str):
+    """Build ETag/Last-Modified headers from the catalog version.
+
+    Returns (headers, not_modified) so callers can answer 304 before touching
+    any catalog rows.
+    """
+    version, updated_at = database.get_catalog_version(db)
+
+    # Same version + same query string => same body
+    query_hash = hashlib.sha1(
+        "&".join(sorted(str(request.query_params).split("&"))).encode("utf-8")
+    ).hexdigest()[:12]
+    etag = f'W/"{resource}-{version}-{query_hash}"'
+
+    last_modified = updated_at.replace(microsecond=0, tzinfo=timezone.utc)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache"
+    }
+
+    # HTTP dates have whole-second resolution: a Last-Modified issued during the
+    # second of the change could not distinguish a further change in that same
+    # second, so only advertise it once that second is over
+    last_modified_final = datetime.now(timezone.utc).replace(microsecond=0) > last_modified
+    if last_modified_final:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return headers, etag in candidates or "*" in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified_final:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return headers, False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return headers, last_modified <= since
+
+    return headers, False
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, update
 from sqlalchemy.orm import sessionmaker
 import models
 from datetime import datetime, timedelta
@@ -16,6 +16,91 @@ def get_db():
     finally:
         db.close()
 
+def create_indexes():
+    """Create indexes missing from an existing database (create_all skips existing tables)"""
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+# Models whose changes invalidate cached catalog/vendor responses
+CATALOG_MODELS = (models.Material, models.Vendor, models.VendorOffer)
+
+@event.listens_for(SessionLocal, "before_flush")
+def bump_catalog_version(session, flush_context, instances):
+    """Increment the catalog version whenever catalog rows are written"""
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    if not any(isinstance(obj, CATALOG_MODELS) for obj in changed):
+        return
+    
+    # Increment in SQL: a read-modify-write here would let two writers both
+    # produce version N+1 for different catalog states, sharing one ETag
+    result = session.execute(
+        update(models.CatalogVersion).where(models.CatalogVersion.id == 1).values(
+            version=models.CatalogVersion.version + 1,
+            updated_at=datetime.utcnow()
+        )
+    )
+    if result.rowcount == 0:
+        session.add(models.CatalogVersion(id=1, version=1, updated_at=datetime.utcnow()))
+
+def _bump_price_version(session, rebuild):
+    # Increment in SQL so concurrent writers in other processes cannot lose a bump
+    values = {"version": models.PriceVersion.version + 1, "updated_at": datetime.utcnow()}
+    if rebuild:
+        values["rebuild_version"] = models.PriceVersion.rebuild_version + 1
+    result = session.execute(
+        update(models.PriceVersion).where(models.PriceVersion.id == 1).values(**values)
+    )
+    if result.rowcount == 0:
+        session.add(models.PriceVersion(
+            id=1,
+            version=1,
+            rebuild_version=1 if rebuild else 0,
+            updated_at=datetime.utcnow()
+        ))
+
+@event.listens_for(SessionLocal, "before_flush")
+def bump_price_version(session, flush_context, instances):
+    """Increment the price version whenever price_indices rows are written"""
+    inserted = any(isinstance(obj, models.PriceIndex) for obj in session.new)
+    rewritten = any(
+        isinstance(obj, models.PriceIndex)
+        for obj in list(session.dirty) + list(session.deleted)
+    )
+    if inserted or rewritten:
+        _bump_price_version(session, rebuild=rewritten)
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def bump_price_version_bulk(orm_execute_state):
+    """Catch bulk query.update()/delete() on price_indices, which skip before_flush"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ is models.PriceIndex:
+        _bump_price_version(orm_execute_state.session, rebuild=True)
+
+def get_price_version(db):
+    """Return (version, rebuild_version) of price_indices; raw SQL writes are not tracked"""
+    # Column query, not db.get(), so a row cached in the session is never returned
+    price_version = db.query(
+        models.PriceVersion.version,
+        models.PriceVersion.rebuild_version
+    ).filter(models.PriceVersion.id == 1).first()
+    if price_version is None:
+        return 0, 0
+    return price_version.version, price_version.rebuild_version
+
+def get_catalog_version(db):
+    """Return (version, updated_at) of the catalog, without loading any catalog rows"""
+    # Column query, not db.get(), so a row cached in the session is never returned
+    catalog_version = db.query(
+        models.CatalogVersion.version,
+        models.CatalogVersion.updated_at
+    ).filter(models.CatalogVersion.id == 1).first()
+    if catalog_version is None:
+        return 0, datetime(1970, 1, 1)
+    return catalog_version.version, catalog_version.updated_at
+
 def seed_data(db):
     """Seed database with demo data"""
     
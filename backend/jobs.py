@@ -0,0 +1,341 @@
+from collections import defaultdict
+from datetime import datetime
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+import database
+import models
+import pricing_engine
+import schemas
+import sweep
+
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "2"))
+PROGRESS_PERSIST_INTERVAL = 1.0  # seconds between progress writes to the DB
+SSE_KEEPALIVE_INTERVAL = 15.0
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+class JobNotCancellable(Exception):
+    """Raised when cancelling a job that is already past its commit point"""
+
+def _load_job(job_id):
+    db = database.SessionLocal()
+    try:
+        return db.get(models.Job, job_id)
+    finally:
+        db.close()
+
+def _update_job(job_id, **fields):
+    db = database.SessionLocal()
+    try:
+        job = db.get(models.Job, job_id)
+        if job is None:
+            return None
+        for key, value in fields.items():
+            setattr(job, key, value)
+        db.commit()
+        db.refresh(job)
+        return job
+    finally:
+        db.close()
+
+def _job_payload(job):
+    return json.loads(schemas.JobResponse.from_orm(job).json())
+
+class JobContext:
+    """Handed to job handlers to report progress and partial results.
+
+    Also arbitrates cancellation against side effects: a handler running work
+    in a thread (which asyncio cannot interrupt) calls begin_commit() before
+    persisting anything. Once that succeeds the job can no longer be cancelled
+    and runs to completion; if the job was cancelled first, the handler must
+    drop its work.
+    """
+
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.job_id = job_id
+        self.cancelled = False
+        self.committed = False
+        # Set on success to report a partial failure alongside the result
+        self.error = None
+        # Set once the job's final status has been written
+        self.finished = asyncio.Event()
+        self._lock = threading.Lock()
+        self._last_persist = 0.0
+
+    def begin_commit(self):
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.committed = True
+            return True
+
+    def request_cancel(self):
+        with self._lock:
+            if self.committed:
+                return False
+            self.cancelled = True
+            return True
+
+    def progress(self, fraction, partial=None):
+        fraction = max(0.0, min(1.0, fraction))
+        event = {"progress": fraction}
+        if partial is not None:
+            event["partial"] = partial
+        self.manager.publish(self.job_id, "progress", event)
+
+        now = time.monotonic()
+        if now - self._last_persist >= PROGRESS_PERSIST_INTERVAL:
+            _update_job(self.job_id, progress=fraction)
+            self._last_persist = now
+
+# Job handlers
+
+def _run_estimate(params, ctx):
+    request = schemas.EstimateRequest(**params)
+    db = database.SessionLocal()
+    try:
+        estimate_data = pricing_engine.generate_estimate(request, db)
+        if not ctx.begin_commit():
+            # Cancelled while generating; the job is already reported as cancelled
+            return None
+        db_estimate = pricing_engine.save_estimate(request, estimate_data, db)
+        return {"id": db_estimate.id, **estimate_data}
+    finally:
+        db.close()
+
+async def run_estimate_job(ctx: JobContext, params):
+    """Generate and save one estimate; not cancellable once saving has begun"""
+    ctx.progress(0.0)
+    return await asyncio.to_thread(_run_estimate, params, ctx)
+
+def _load_sweep_snapshot():
+    db = database.SessionLocal()
+    try:
+        return pricing_engine.load_pricing_snapshot(db)
+    finally:
+        db.close()
+
+async def run_sweep_job(ctx: JobContext, params):
+    """Run a parameter sweep, streaming completed grid points as partial results"""
+    request = schemas.SweepRequest(**params)
+    grid = sweep.build_grid(request)
+    snapshot = await asyncio.to_thread(_load_sweep_snapshot)
+
+    results = []
+    batch = []
+    failed = []
+    async for line in sweep.stream_sweep(request, grid, snapshot):
+        point = json.loads(line)
+        results.append(point)
+        batch.append(point)
+        if "error" in point:
+            failed.append(point)
+        if len(batch) >= 100 or len(results) == len(grid):
+            ctx.progress(len(results) / len(grid), partial=batch)
+            batch = []
+
+    if failed and len(failed) == len(results):
+        raise RuntimeError(f"All {len(failed)} grid points failed: {failed[0]['error']}")
+    if failed:
+        ctx.error = f"{len(failed)} of {len(results)} grid points failed: {failed[0]['error']}"
+
+    results.sort(key=lambda point: point["index"])
+    return results
+
+JOB_HANDLERS = {
+    "estimate": run_estimate_job,
+    "sweep": run_sweep_job
+}
+
+class JobManager:
+    """In-process job scheduler: a priority queue drained by a fixed number of asyncio workers.
+
+    Job state lives in the jobs table; progress events are fanned out to
+    in-memory subscribers for Server-Sent Events.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENT_JOBS):
+        self.max_concurrency = max_concurrency
+        self.queue = None
+        self.workers = []
+        self.running = {}
+        self.contexts = {}
+        self.subscribers = defaultdict(set)
+        self._sequence = itertools.count()
+        self._stopping = False
+
+    async def start(self):
+        self.queue = asyncio.PriorityQueue()
+        self._stopping = False
+
+        # Recover jobs left behind by a previous process
+        db = database.SessionLocal()
+        try:
+            interrupted = db.query(models.Job).filter(models.Job.status == "running").all()
+            for job in interrupted:
+                job.status = "failed"
+                job.error = "Interrupted by server restart"
+                job.finished_at = datetime.utcnow()
+            db.commit()
+
+            queued = db.query(models.Job).filter(
+                models.Job.status == "queued"
+            ).order_by(models.Job.created_at).all()
+            for job in queued:
+                self._enqueue(job.id, job.priority)
+        finally:
+            db.close()
+
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def stop(self):
+        self._stopping = True
+        # Jobs past their commit point finish normally so their side effects
+        # are recorded; everything else is cancelled and re-queued
+        committed = [
+            task for job_id, task in self.running.items()
+            if not self.contexts[job_id].request_cancel()
+        ]
+        await asyncio.gather(*committed, return_exceptions=True)
+
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def _enqueue(self, job_id, priority):
+        # Higher priority first, FIFO within a priority
+        self.queue.put_nowait((-priority, next(self._sequence), job_id))
+
+    def submit(self, kind, params, priority=0):
+        """Persist a new job and queue it"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        db = database.SessionLocal()
+        try:
+            job = models.Job(
+                id=str(uuid.uuid4()),
+                kind=kind,
+                status="queued",
+                priority=priority,
+                params=params,
+                progress=0.0,
+                created_at=datetime.utcnow()
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+        finally:
+            db.close()
+
+        self._enqueue(job.id, priority)
+        return job
+
+    async def cancel(self, job_id):
+        """Cancel a queued or running job; returns the job, or None if not found.
+
+        Waits for a running job to stop, so the returned job is already
+        cancelled. Raises JobNotCancellable once the job is past its commit point.
+        """
+        job = _load_job(job_id)
+        if job is None or job.status in TERMINAL_STATUSES:
+            return job
+
+        task = self.running.get(job_id)
+        if task is not None:
+            ctx = self.contexts[job_id]
+            if not ctx.request_cancel():
+                raise JobNotCancellable(f"Job {job_id} is saving its result and can no longer be cancelled")
+            task.cancel()
+            await ctx.finished.wait()
+            return _load_job(job_id)
+
+        # Still queued: the worker skips it when dequeued
+        job = self._finish(job_id, status="cancelled")
+        return job
+
+    def publish(self, job_id, event, data):
+        for subscriber in list(self.subscribers.get(job_id, ())):
+            subscriber.put_nowait((event, data))
+
+    def _finish(self, job_id, **fields):
+        job = _update_job(job_id, finished_at=datetime.utcnow(), **fields)
+        if job is not None:
+            self.publish(job_id, "status", _job_payload(job))
+        return job
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job_id):
+        job = _load_job(job_id)
+        if job is None or job.status != "queued" or self._stopping:
+            return
+
+        job = _update_job(job_id, status="running", started_at=datetime.utcnow())
+        self.publish(job_id, "status", _job_payload(job))
+
+        handler = JOB_HANDLERS[job.kind]
+        ctx = JobContext(self, job_id)
+        task = asyncio.create_task(handler(ctx, job.params))
+        self.running[job_id] = task
+        self.contexts[job_id] = ctx
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if self._stopping:
+                # Server shutdown: leave the job queued so the next start picks it up
+                _update_job(job_id, status="queued", progress=0.0, started_at=None)
+                raise
+            self._finish(job_id, status="cancelled")
+        except Exception as e:
+            self._finish(job_id, status="failed", error=str(e))
+        else:
+            self._finish(job_id, status="succeeded", progress=1.0, result=result, error=ctx.error)
+        finally:
+            self.running.pop(job_id, None)
+            self.contexts.pop(job_id, None)
+            ctx.finished.set()
+
+    async def events(self, job_id):
+        """Yield Server-Sent Events for a job until it reaches a terminal status"""
+        subscriber = asyncio.Queue()
+        self.subscribers[job_id].add(subscriber)
+        try:
+            # Subscribe before reading state so the terminal event cannot be missed
+            job = _load_job(job_id)
+            if job is None:
+                return
+            yield _format_event("status", _job_payload(job))
+            if job.status in TERMINAL_STATUSES:
+                return
+
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(subscriber.get(), SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _format_event(event, data)
+                if event == "status" and data["status"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            self.subscribers[job_id].discard(subscriber)
+            if not self.subscribers[job_id]:
+                del self.subscribers[job_id]
+
+def _format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+manager = JobManager()
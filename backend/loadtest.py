@@ -0,0 +1,382 @@
+"""Load generator and latency SLO gate for the pricing API.
+
+Replays a weighted mix of estimate runs, estimate fetches and exports with a
+closed loop of concurrent clients, then reports throughput, error rate and
+p50/p95/p99 latency per operation. Exits non-zero when a budget is exceeded.
+
+    python loadtest.py                                  # starts a throwaway local server
+    python loadtest.py --url http://localhost:8000 --concurrency 1,4,16
+
+Runs create estimates and export files on the target, so --url should not
+point at a server whose data matters.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import pricing_engine
+import schemas
+
+DEFAULT_BUDGETS_FILE = "loadtest_budgets.json"
+BUDGET_PERCENTILES = ("p50", "p95", "p99")
+SERVER_STARTUP_TIMEOUT = 60.0
+
+# Realistic request ranges per seeded project template
+PROJECT_PROFILES = {
+    "bridge": {"size_unit": "lane_km", "size": (0.5, 5.0), "duration_months": (12, 36)},
+    "hotel": {"size_unit": "rooms", "size": (40, 400), "duration_months": (18, 36)},
+    "business_park": {"size_unit": "m2", "size": (5000, 60000), "duration_months": (12, 30)}
+}
+LOCATIONS = ["Athens, Greece", "Thessaloniki, Greece", "Patras, Greece", "Heraklion, Greece"]
+
+DEFAULT_MIX = {
+    "estimate_run": 0.4,
+    "estimate_get": 0.4,
+    "export_csv": 0.1,
+    "export_pdf": 0.1
+}
+
+def random_estimate_request(rng):
+    """Build a valid EstimateRequest payload for one of the seeded templates"""
+    project_type = rng.choice(sorted(pricing_engine.PROJECT_TEMPLATES))
+    profile = PROJECT_PROFILES[project_type]
+    request = schemas.EstimateRequest(
+        project_type=project_type,
+        location=rng.choice(LOCATIONS),
+        size=round(rng.uniform(*profile["size"]), 1),
+        size_unit=profile["size_unit"],
+        start_month=rng.randint(1, 12),
+        duration_months=rng.randint(*profile["duration_months"])
+    )
+    return request.dict(exclude_none=True)
+
+class Client:
+    """Keep-alive HTTP client, one per load thread"""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.connect()
+            # Small requests otherwise stall on Nagle + delayed ACK and skew latencies
+            self.conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        payload = json.dumps(body) if body is not None else None
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        return response.status, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+def _seed_estimates(base_url, count, rng, timeout):
+    """Create estimates up front so fetch/export operations have ids to hit"""
+    client = Client(base_url, timeout)
+    estimate_ids = []
+    try:
+        for _ in range(count):
+            status, data = client.request("POST", "/estimate/run", random_estimate_request(rng))
+            try:
+                if status != 200:
+                    raise ValueError(f"HTTP {status}")
+                estimate_ids.append(json.loads(data)["id"])
+            except (ValueError, KeyError, TypeError) as e:
+                raise RuntimeError(f"Seeding estimates failed ({e}): {data[:200]!r}")
+    finally:
+        client.close()
+    return estimate_ids
+
+def _run_operation(client, operation, rng, estimate_ids, lock):
+    if operation == "estimate_run":
+        status, data = client.request("POST", "/estimate/run", random_estimate_request(rng))
+        if status == 200:
+            with lock:
+                estimate_ids.append(json.loads(data)["id"])
+        return status
+
+    with lock:
+        estimate_id = rng.choice(estimate_ids)
+    if operation == "estimate_get":
+        return client.request("GET", f"/estimate/{estimate_id}")[0]
+    if operation == "export_csv":
+        return client.request("GET", f"/export/{estimate_id}.csv")[0]
+    if operation == "export_pdf":
+        return client.request("GET", f"/export/{estimate_id}.pdf")[0]
+    raise ValueError(f"Unknown operation: {operation}")
+
+def run_level(base_url, concurrency, duration, mix, estimate_ids, seed, timeout):
+    """Drive the API with `concurrency` closed-loop clients for `duration` seconds"""
+    operations = list(mix)
+    weights = [mix[op] for op in operations]
+    samples = {op: [] for op in operations}
+    errors = {op: 0 for op in operations}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = random.Random(seed + worker_id)
+        client = Client(base_url, timeout)
+        try:
+            while time.perf_counter() < deadline:
+                operation = rng.choices(operations, weights)[0]
+                start = time.perf_counter()
+                try:
+                    status = _run_operation(client, operation, rng, estimate_ids, lock)
+                    failed = status >= 400
+                except Exception:
+                    # Any failure (connection, timeout, malformed body) is an error
+                    # sample; it must not kill the client thread and abort the run
+                    failed = True
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                with lock:
+                    samples[operation].append(elapsed_ms)
+                    if failed:
+                        errors[operation] += 1
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    report = {op: _summarize(samples[op], errors[op], elapsed) for op in operations}
+    report["all"] = _summarize(
+        [ms for op in operations for ms in samples[op]],
+        sum(errors.values()),
+        elapsed
+    )
+    return report
+
+def _summarize(latencies_ms, error_count, elapsed):
+    count = len(latencies_ms)
+    if count == 0:
+        return {"requests": 0, "errors": 0, "error_rate": 0.0, "throughput_rps": 0.0,
+                "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        "requests": count,
+        "errors": error_count,
+        "error_rate": error_count / count,
+        "throughput_rps": count / elapsed,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99)
+    }
+
+def _is_number(value):
+    # bool is an int subclass, but true/false is never a meaningful limit
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def load_budgets(path):
+    """Read and validate a budgets file, raising ValueError on unknown keys or bad values"""
+    with open(path, encoding="utf-8") as f:
+        budgets = json.load(f)
+    if not isinstance(budgets, dict):
+        raise ValueError("budgets must be a JSON object")
+
+    unknown = set(budgets) - {"max_error_rate", "latency_ms"}
+    if unknown:
+        raise ValueError(f"unknown budget keys: {', '.join(sorted(unknown))}")
+    if not _is_number(budgets.get("max_error_rate", 0)):
+        raise ValueError("max_error_rate must be a number")
+
+    latency_ms = budgets.get("latency_ms", {})
+    if not isinstance(latency_ms, dict):
+        raise ValueError("latency_ms must be a JSON object of operations")
+
+    operations = set(DEFAULT_MIX) | {"all"}
+    for operation, limits in latency_ms.items():
+        if operation not in operations:
+            raise ValueError(
+                f"unknown operation {operation!r}; expected one of {', '.join(sorted(operations))}"
+            )
+        if not isinstance(limits, dict):
+            raise ValueError(f"latency_ms.{operation} must be a JSON object of percentiles")
+        for percentile, limit in limits.items():
+            if percentile not in BUDGET_PERCENTILES:
+                raise ValueError(
+                    f"unknown percentile {percentile!r} for {operation}; "
+                    f"expected one of {', '.join(BUDGET_PERCENTILES)}"
+                )
+            if not _is_number(limit):
+                raise ValueError(f"{operation} {percentile} limit must be a number")
+    return budgets
+
+def check_budgets(report, budgets):
+    """Return a list of budget violations for one concurrency level"""
+    violations = []
+    max_error_rate = budgets.get("max_error_rate")
+    if max_error_rate is not None and report["all"]["error_rate"] > max_error_rate:
+        violations.append(
+            f"error rate {report['all']['error_rate']:.2%} > {max_error_rate:.2%}"
+        )
+
+    for operation, limits in budgets.get("latency_ms", {}).items():
+        stats = report.get(operation)
+        if not stats or not stats["requests"]:
+            continue
+        for percentile, limit in limits.items():
+            observed = stats[f"{percentile}_ms"]
+            if observed > limit:
+                violations.append(f"{operation} {percentile} {observed:.1f}ms > {limit}ms")
+    return violations
+
+def print_report(concurrency, report):
+    print(f"\nconcurrency={concurrency}")
+    print(f"{'operation':<14}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for operation, stats in report.items():
+        if not stats["requests"]:
+            continue
+        print(
+            f"{operation:<14}{stats['requests']:>9}{stats['errors']:>8}"
+            f"{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>9.1f}"
+            f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+        )
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_local_server(timeout):
+    """Start uvicorn serving main:app in a separate process on a free localhost port.
+
+    A separate process keeps the load generator's threads from competing with
+    the API for the GIL, so results reflect one API instance. It runs in a
+    scratch directory, so its SQLite database, reports and price cube are
+    throwaway copies rather than the developer's. Returns (process, base_url, workdir).
+    """
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    process = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+        "--host", "127.0.0.1",
+        "--port", str(port),
+        "--log-level", "warning"
+    ], cwd=workdir)
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + SERVER_STARTUP_TIMEOUT
+    client = Client(base_url, timeout)
+    try:
+        while True:
+            if process.poll() is not None:
+                stop_local_server(process, workdir)
+                raise RuntimeError(f"Local server exited with code {process.returncode}")
+            try:
+                if client.request("GET", "/")[0] == 200:
+                    return process, base_url, workdir
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                stop_local_server(process, workdir)
+                raise RuntimeError("Local server did not start in time")
+            time.sleep(0.1)
+    finally:
+        client.close()
+
+def stop_local_server(process, workdir):
+    """Stop the local server and delete its scratch directory"""
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the pricing API and enforce latency budgets")
+    parser.add_argument("--url", help="Target a running server instead of starting a local one. "
+                                      "The run writes estimates and export files to that server")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="Comma-separated client counts to step through (default: 1,4,16)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--mix", type=json.loads, default=DEFAULT_MIX,
+                        help="JSON object of operation weights, e.g. '{\"estimate_run\": 1}'")
+    parser.add_argument("--budgets", default=DEFAULT_BUDGETS_FILE,
+                        help="JSON budgets file; pass an empty string to disable the gate")
+    parser.add_argument("--seed-estimates", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for reproducible mixes")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--json", dest="json_path", help="Also write the full report to this file")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.mix) - set(DEFAULT_MIX)
+    if unknown:
+        parser.error(f"Unknown operations in --mix: {', '.join(sorted(unknown))}")
+
+    budgets = {}
+    if args.budgets:
+        try:
+            budgets = load_budgets(args.budgets)
+        except (OSError, ValueError) as e:
+            parser.error(f"Invalid budgets file {args.budgets}: {e}")
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server, base_url, workdir = start_local_server(args.timeout)
+    else:
+        print(f"Warning: this run creates estimates and export files on {base_url}", file=sys.stderr)
+
+    try:
+        rng = random.Random(args.seed)
+        estimate_ids = _seed_estimates(base_url, max(1, args.seed_estimates), rng, args.timeout)
+
+        results = {}
+        failures = {}
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            report = run_level(base_url, concurrency, args.duration, args.mix,
+                               estimate_ids, args.seed, args.timeout)
+            print_report(concurrency, report)
+            results[concurrency] = report
+            violations = check_budgets(report, budgets)
+            if violations:
+                failures[concurrency] = violations
+    finally:
+        if server is not None:
+            stop_local_server(server, workdir)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "budgets": budgets, "failures": failures}, f, indent=2)
+
+    if failures:
+        print("\nLatency budget exceeded:")
+        for concurrency, violations in failures.items():
+            for violation in violations:
+                print(f"  concurrency={concurrency}: {violation}")
+        return 1
+
+    print("\nAll budgets met" if budgets else "\nNo budgets configured")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
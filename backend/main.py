@@ -1,12 +1,12 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
-import models, schemas, database, pricing_engine
+from typing import Optional
+import models, schemas, database, pricing_engine, catalog, sweep, price_cube, jobs
 from database import get_db
 import json
-from datetime import datetime
-import uuid
+import numpy as np
 import os
 
 app = FastAPI(title="AI Pricing & Sourcing API", version="1.0.0")
@@ -17,16 +17,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-Next-Cursor"],
 )
 
 # Create tables
 models.Base.metadata.create_all(bind=database.engine)
+database.create_indexes()
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database with seed data"""
     db = next(get_db())
     database.seed_data(db)
+    price_cube.ensure_fresh(db)
+    await jobs.manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop job workers and the sweep pool; running jobs are re-queued for the next start"""
+    await jobs.manager.stop()
+    sweep.shutdown_pool()
 
 @app.get("/")
 async def root():
@@ -40,14 +50,7 @@ async def create_estimate(request: schemas.EstimateRequest, db: Session = Depend
         estimate_data = pricing_engine.generate_estimate(request, db)
         
         # Save estimate to database
-        db_estimate = models.Estimate(
-            id=str(uuid.uuid4()),
-            project_meta=request.dict(),
-            results=estimate_data,
-            created_at=datetime.utcnow()
-        )
-        db.add(db_estimate)
-        db.commit()
+        db_estimate = pricing_engine.save_estimate(request, estimate_data, db)
         
         return schemas.EstimateResponse(
             id=db_estimate.id,
@@ -56,6 +59,24 @@ async def create_estimate(request: schemas.EstimateRequest, db: Session = Depend
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/estimate/sweep")
+async def sweep_estimates(request: schemas.SweepRequest, db: Session = Depends(get_db)):
+    """Run a size x start month x location sensitivity sweep across worker processes.
+    
+    Streams one NDJSON line per grid point as results complete.
+    """
+    try:
+        grid = sweep.build_grid(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Full snapshot so every project type shares the same worker pool
+    snapshot = pricing_engine.load_pricing_snapshot(db)
+    return StreamingResponse(
+        sweep.stream_sweep(request, grid, snapshot),
+        media_type="application/x-ndjson"
+    )
+
 @app.get("/estimate/{estimate_id}", response_model=schemas.EstimateResponse)
 async def get_estimate(estimate_id: str, db: Session = Depends(get_db)):
     """Retrieve saved estimate"""
@@ -68,17 +89,133 @@ async def get_estimate(estimate_id: str, db: Session = Depends(get_db)):
         **estimate.results
     )
 
+@app.post("/jobs/estimate", response_model=schemas.JobResponse, status_code=202)
+async def submit_estimate_job(request: schemas.EstimateRequest, priority: int = 0):
+    """Queue an estimate to run in the background"""
+    return jobs.manager.submit("estimate", request.dict(), priority)
+
+@app.post("/jobs/sweep", response_model=schemas.JobResponse, status_code=202)
+async def submit_sweep_job(request: schemas.SweepRequest, priority: int = 0):
+    """Queue a parameter sweep to run in the background"""
+    try:
+        sweep.build_grid(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return jobs.manager.submit("sweep", request.dict(), priority)
+
+@app.get("/jobs/{job_id}", response_model=schemas.JobResponse)
+async def get_job(job_id: str, db: Session = Depends(get_db)):
+    """Get job status and, once finished, its result"""
+    job = db.get(models.Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, db: Session = Depends(get_db)):
+    """Stream job status, progress and partial results as Server-Sent Events"""
+    if not db.get(models.Job, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        jobs.manager.events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.delete("/jobs/{job_id}", response_model=schemas.JobResponse)
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    try:
+        job = await jobs.manager.cancel(job_id)
+    except jobs.JobNotCancellable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.get("/catalog/items")
-async def get_catalog_items(db: Session = Depends(get_db)):
-    """Get material catalog"""
-    materials = db.query(models.Material).all()
-    return [schemas.MaterialResponse.from_orm(m) for m in materials]
+async def get_catalog_items(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: int = Query(catalog.DEFAULT_PAGE_SIZE, ge=1, le=catalog.MAX_PAGE_SIZE),
+    category: Optional[str] = None,
+    q: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Get material catalog (cursor-paginated, filterable, cached by catalog version)"""
+    headers, not_modified = catalog.cache_headers(db, request, "items")
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    
+    filters = []
+    if category:
+        filters.append(models.Material.category == category)
+    if q:
+        filters.append(catalog.name_prefix_filter(models.Material.name, q))
+    
+    items, next_cursor = catalog.fetch_page(
+        db, models.Material, schemas.MaterialResponse, filters, cursor, limit, fields
+    )
+    response.headers.update(headers)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return items
 
 @app.get("/vendors")
-async def get_vendors(db: Session = Depends(get_db)):
-    """Get vendor database"""
-    vendors = db.query(models.Vendor).all()
-    return [schemas.VendorResponse.from_orm(v) for v in vendors]
+async def get_vendors(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: int = Query(catalog.DEFAULT_PAGE_SIZE, ge=1, le=catalog.MAX_PAGE_SIZE),
+    region: Optional[str] = None,
+    q: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Get vendor database (cursor-paginated, filterable, cached by catalog version)"""
+    headers, not_modified = catalog.cache_headers(db, request, "vendors")
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    
+    filters = []
+    if region:
+        filters.append(models.Vendor.region == region)
+    if q:
+        filters.append(catalog.name_prefix_filter(models.Vendor.name, q))
+    
+    vendors, next_cursor = catalog.fetch_page(
+        db, models.Vendor, schemas.VendorResponse, filters, cursor, limit, fields
+    )
+    response.headers.update(headers)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return vendors
+
+@app.get("/analytics/prices/{mapping_key}")
+async def get_price_history(mapping_key: str, region: str = "Greece", db: Session = Depends(get_db)):
+    """Get price history for a material/region from the price cube (or the DB while it refreshes)"""
+    # Same material resolution as the pricing engine
+    material = db.query(models.Material).filter(models.Material.mapping_key == mapping_key).first()
+    series = None
+    if material:
+        cube = price_cube.current_cube(db)
+        series = (
+            cube.series(material.id, region) if cube
+            else price_cube.query_series(db, material.id, region)
+        )
+    if series is None:
+        raise HTTPException(status_code=404, detail="No price history for material/region")
+    
+    dates, prices = series
+    observed = ~np.isnan(prices)
+    return {
+        "material": mapping_key,
+        "region": region,
+        "dates": [str(d) for d in dates[observed]],
+        "prices": prices[observed].tolist()
+    }
 
 @app.get("/export/{estimate_id}.pdf")
 async def export_pdf(estimate_id: str, db: Session = Depends(get_db)):
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey, Text, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -11,12 +11,15 @@ class Material(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     unit = Column(String)
-    category = Column(String)
+    category = Column(String, index=True)
     spec = Column(Text)
     mapping_key = Column(String, index=True)
     
     price_indices = relationship("PriceIndex", back_populates="material")
     seasonality = relationship("Seasonality", back_populates="material")
+    
+    # Case-insensitive prefix search on name
+    __table_args__ = (Index("ix_materials_name_nocase", text("name COLLATE NOCASE")),)
 
 class PriceIndex(Base):
     __tablename__ = "price_indices"
@@ -44,11 +47,14 @@ class Vendor(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    region = Column(String)
+    region = Column(String, index=True)
     contacts = Column(JSON)
     reliability_score = Column(Float)
     
     offers = relationship("VendorOffer", back_populates="vendor")
+    
+    # Case-insensitive prefix search on name
+    __table_args__ = (Index("ix_vendors_name_nocase", text("name COLLATE NOCASE")),)
 
 class VendorOffer(Base):
     __tablename__ = "vendor_offers"
@@ -71,4 +77,34 @@ class Estimate(Base):
     id = Column(String, primary_key=True, index=True)
     project_meta = Column(JSON)
     results = Column(JSON)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class PriceVersion(Base):
+    __tablename__ = "price_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0)  # bumped on any price_indices write
+    rebuild_version = Column(Integer, default=0)  # bumped on updates/deletes, which need a full cube export
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(String, primary_key=True, index=True)
+    kind = Column(String)
+    status = Column(String, index=True)  # queued, running, succeeded, failed, cancelled
+    priority = Column(Integer, default=0)
+    params = Column(JSON)
+    progress = Column(Float, default=0.0)
+    result = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
\ No newline at end of file
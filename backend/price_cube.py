@@ -0,0 +1,287 @@
+from contextlib import contextmanager
+from sqlalchemy.orm import Session
+import numpy as np
+import glob
+import json
+import os
+import threading
+import uuid
+import database
+import models
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CUBE_DIR = os.environ.get("PRICE_CUBE_DIR", "price_cube")
+META_FILE = "meta.json"
+LOCK_FILE = "refresh.lock"
+
+class PriceCube:
+    """Read-only material x region x date price cube backed by memory-mapped .npy files.
+
+    The material axis holds material ids. Missing observations are NaN. Every
+    process that opens the cube maps the same files, so they share one copy in
+    the page cache.
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.materials = meta["materials"]
+        self.regions = meta["regions"]
+        self.version = meta["version"]
+        self.dates = np.load(os.path.join(path, meta["dates_file"]), mmap_mode="r")
+        self.prices = np.load(os.path.join(path, meta["prices_file"]), mmap_mode="r")
+        self._material_index = {material_id: i for i, material_id in enumerate(self.materials)}
+        self._region_index = {region: i for i, region in enumerate(self.regions)}
+
+    def series(self, material_id, region):
+        """Return (dates, prices) for one material/region as zero-copy views, or None"""
+        m = self._material_index.get(material_id)
+        r = self._region_index.get(region)
+        if m is None or r is None:
+            return None
+        return self.dates, self.prices[m, r]
+
+    def latest_price(self, material_id, region):
+        """Most recent observed price for a material/region, or None"""
+        series = self.series(material_id, region)
+        if series is None:
+            return None
+        observed = np.flatnonzero(~np.isnan(series[1]))
+        if len(observed) == 0:
+            return None
+        return float(series[1][observed[-1]])
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_meta(path, meta):
+    tmp_path = os.path.join(path, f"{META_FILE}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+
+def _remove_stale_generations(path, meta):
+    # Readers that already mapped an old generation keep it through their open
+    # handle; Windows refuses to delete mapped files, so those are left for later
+    current = {meta["prices_file"], meta["dates_file"]}
+    for pattern in ("prices-*.npy", "dates-*.npy", f"{META_FILE}.*.tmp"):
+        for file_path in glob.glob(os.path.join(path, pattern)):
+            if os.path.basename(file_path) in current:
+                continue
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+@contextmanager
+def _exclusive_lock(path):
+    """Serialize cube writers across threads and processes"""
+    with open(os.path.join(path, LOCK_FILE), "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def refresh(db: Session, path=CUBE_DIR, full=False):
+    """Bring the cube up to the current price version.
+
+    Inserts since the last export are applied incrementally: new cells on
+    existing axes are written in place, while new materials, regions or dates
+    produce a new file generation that is swapped in atomically so open readers
+    keep a consistent view. Updates and deletes (tracked by rebuild_version)
+    force a full export. Runs under an exclusive file lock; a writer that finds
+    the cube already caught up returns without touching it.
+    """
+    os.makedirs(path, exist_ok=True)
+    with _exclusive_lock(path):
+        # Read the version before the rows, so the rows cover at least this version
+        version, rebuild_version = database.get_price_version(db)
+        meta = _read_meta(path)
+        if meta and not full and meta.get("version") == version \
+                and meta.get("rebuild_version") == rebuild_version:
+            return
+        # Metadata from an older cube layout has no rebuild_version, so it is rebuilt too
+        if full or meta is None or meta.get("rebuild_version") != rebuild_version:
+            meta = None
+        _export(db, path, meta, version, rebuild_version)
+
+def _export(db, path, meta, version, rebuild_version):
+    last_id = meta["last_id"] if meta else 0
+    rows = db.query(
+        models.PriceIndex.id,
+        models.PriceIndex.material_id,
+        models.PriceIndex.region,
+        models.PriceIndex.date,
+        models.PriceIndex.unit_price
+    ).filter(
+        models.PriceIndex.id > last_id,
+        models.PriceIndex.material_id.isnot(None)
+    ).order_by(models.PriceIndex.id).all()
+
+    old_materials = meta["materials"] if meta else []
+    old_regions = meta["regions"] if meta else []
+    old_dates = (
+        np.load(os.path.join(path, meta["dates_file"]))
+        if meta else np.array([], dtype="datetime64[s]")
+    )
+
+    row_dates = np.array([row.date for row in rows], dtype="datetime64[s]")
+    materials = old_materials + sorted({row.material_id for row in rows} - set(old_materials))
+    regions = old_regions + sorted({row.region for row in rows} - set(old_regions))
+    dates = np.union1d(old_dates, row_dates)
+
+    if meta and len(materials) == len(old_materials) and len(regions) == len(old_regions) \
+            and len(dates) == len(old_dates):
+        # Axes unchanged: write the new observations straight into the mapped file
+        prices = np.load(os.path.join(path, meta["prices_file"]), mmap_mode="r+")
+        generation = meta
+    else:
+        generation = {
+            "prices_file": f"prices-{uuid.uuid4().hex}.npy",
+            "dates_file": f"dates-{uuid.uuid4().hex}.npy"
+        }
+        np.save(os.path.join(path, generation["dates_file"]), dates)
+        prices = np.lib.format.open_memmap(
+            os.path.join(path, generation["prices_file"]),
+            mode="w+",
+            dtype=np.float64,
+            shape=(len(materials), len(regions), len(dates))
+        )
+        prices[:] = np.nan
+        if meta:
+            old_prices = np.load(os.path.join(path, meta["prices_file"]), mmap_mode="r")
+            prices[np.ix_(
+                np.arange(len(old_materials)),
+                np.arange(len(old_regions)),
+                np.searchsorted(dates, old_dates)
+            )] = old_prices
+
+    material_index = {material_id: i for i, material_id in enumerate(materials)}
+    region_index = {region: i for i, region in enumerate(regions)}
+    if rows:
+        m = np.array([material_index[row.material_id] for row in rows])
+        r = np.array([region_index[row.region] for row in rows])
+        d = np.searchsorted(dates, row_dates)
+        # Rows are ordered by id, so later observations of a cell win
+        prices[m, r, d] = np.array([row.unit_price for row in rows], dtype=np.float64)
+    prices.flush()
+    del prices
+
+    new_meta = {
+        "materials": materials,
+        "regions": regions,
+        "last_id": rows[-1].id if rows else last_id,
+        "version": version,
+        "rebuild_version": rebuild_version,
+        "prices_file": generation["prices_file"],
+        "dates_file": generation["dates_file"]
+    }
+    _write_meta(path, new_meta)
+    _remove_stale_generations(path, new_meta)
+
+# Cube opened by this process, reopened when meta.json is replaced
+_cube = None
+_cube_stamp = None
+
+def get_cube(path=CUBE_DIR):
+    """Return the process-wide cube, or None if it has not been exported yet"""
+    global _cube, _cube_stamp
+    for _ in range(3):
+        try:
+            stat = os.stat(os.path.join(path, META_FILE))
+        except FileNotFoundError:
+            return None
+
+        # meta.json is always replaced, never rewritten, so a new inode means a new export
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if _cube is not None and _cube.path == path and _cube_stamp == stamp:
+            return _cube
+
+        meta = _read_meta(path)
+        if meta is None or "version" not in meta:
+            return None
+        try:
+            cube = PriceCube(path, meta)
+        except FileNotFoundError:
+            # A writer swapped in a newer generation between reading meta and mapping files
+            continue
+        _cube, _cube_stamp = cube, stamp
+        return _cube
+    return None
+
+def ensure_fresh(db: Session, path=CUBE_DIR):
+    """Return the cube after applying any price_indices writes it has not seen yet.
+
+    Blocks for the whole export, so it is only for startup and scripts; request
+    handlers use current_cube().
+    """
+    version, _ = database.get_price_version(db)
+    cube = get_cube(path)
+    if cube is None or cube.version != version:
+        refresh(db, path)
+        cube = get_cube(path)
+    return cube
+
+# Held while this process has a background refresh running
+_background_refresh = threading.Lock()
+
+def refresh_in_background(path=CUBE_DIR):
+    """Refresh the cube on a daemon thread unless this process already is"""
+    if not _background_refresh.acquire(blocking=False):
+        return
+
+    def run():
+        db = database.SessionLocal()
+        try:
+            refresh(db, path)
+        except Exception as e:
+            print(f"Price cube refresh failed: {e}")
+        finally:
+            db.close()
+            _background_refresh.release()
+
+    threading.Thread(target=run, name="price-cube-refresh", daemon=True).start()
+
+def current_cube(db: Session, path=CUBE_DIR):
+    """Return the cube if it is up to date with price_indices, else None.
+
+    Never exports on the calling thread: a stale cube starts a background
+    refresh and callers read price_indices directly until it lands.
+    """
+    version, _ = database.get_price_version(db)
+    cube = get_cube(path)
+    if cube is not None and cube.version == version:
+        return cube
+    refresh_in_background(path)
+    return None
+
+def query_series(db: Session, material_id, region):
+    """Read one material/region series from price_indices, in the shape of PriceCube.series"""
+    rows = db.query(models.PriceIndex.date, models.PriceIndex.unit_price).filter(
+        models.PriceIndex.material_id == material_id,
+        models.PriceIndex.region == region
+    ).order_by(models.PriceIndex.id).all()
+    if not rows:
+        return None
+    # Later observations of a date win, as in the cube
+    by_date = {np.datetime64(row.date, "s"): row.unit_price for row in rows}
+    dates = np.array(sorted(by_date), dtype="datetime64[s]")
+    return dates, np.array([by_date[d] for d in dates], dtype=np.float64)
@@ -1,5 +1,6 @@
 import models
 import schemas
+import price_cube
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 import pandas as pd
@@ -10,6 +11,7 @@ from reportlab.lib import colors
 from reportlab.lib.units import inch
 import os
 import csv
+import uuid
 
 # Project templates with parametric models
 PROJECT_TEMPLATES = {
@@ -42,8 +44,94 @@ PROJECT_TEMPLATES = {
     }
 }
 
+def load_pricing_snapshot(db: Session, mapping_keys=None):
+    """Load everything generate_estimate needs into plain, picklable data.
+
+    The snapshot is keyed by material mapping_key and is read-only, so it can be
+    shared with worker processes for parameter sweeps. Defaults to the materials
+    of every project template.
+    """
+    if mapping_keys is None:
+        mapping_keys = {key for template in PROJECT_TEMPLATES.values() for key in template}
+    snapshot = {}
+    # None while the cube is catching up with price_indices; the DB is read instead
+    cube = price_cube.current_cube(db)
+    
+    for material_key in mapping_keys:
+        # Get material
+        material = db.query(models.Material).filter(
+            models.Material.mapping_key == material_key
+        ).first()
+        
+        if not material:
+            continue
+        
+        # Get base price, from the price cube when it has been exported
+        base_price = cube.latest_price(material.id, "Greece") if cube else None
+        if base_price is None:
+            latest_price = db.query(models.PriceIndex).filter(
+                models.PriceIndex.material_id == material.id,
+                models.PriceIndex.region == "Greece"
+            ).order_by(models.PriceIndex.date.desc()).first()
+            
+            if not latest_price:
+                continue
+            base_price = latest_price.unit_price
+        
+        seasonality = {
+            s.month: s.factor
+            for s in db.query(models.Seasonality).filter(
+                models.Seasonality.material_id == material.id
+            ).all()
+        }
+        
+        # Cheapest three offers
+        vendor_offers = db.query(models.VendorOffer).filter(
+            models.VendorOffer.material_id == material.id
+        ).join(models.Vendor).order_by(models.VendorOffer.unit_price).limit(3).all()
+        
+        offers = [
+            {
+                "vendor_name": vendor_offer.vendor.name,
+                "location": vendor_offer.vendor.region,
+                "price": vendor_offer.unit_price,
+                "stock_qty": vendor_offer.stock_qty,
+                "lead_time_days": vendor_offer.lead_time_days,
+                "moq": vendor_offer.moq,
+                "contact": vendor_offer.vendor.contacts.get("email", "N/A")
+            }
+            for vendor_offer in vendor_offers
+        ]
+        
+        snapshot[material_key] = {
+            "name": material.name,
+            "unit": material.unit,
+            "base_price": base_price,
+            "seasonality": seasonality,
+            "offers": offers
+        }
+    
+    return snapshot
+
 def generate_estimate(request: schemas.EstimateRequest, db: Session):
     """Generate complete project estimate with BoQ, pricing, and vendor recommendations"""
+    template = PROJECT_TEMPLATES.get(request.project_type, {})
+    return compute_estimate(request, load_pricing_snapshot(db, template.keys()))
+
+def save_estimate(request: schemas.EstimateRequest, estimate_data, db: Session):
+    """Persist a generated estimate and return the stored row"""
+    db_estimate = models.Estimate(
+        id=str(uuid.uuid4()),
+        project_meta=request.dict(),
+        results=estimate_data,
+        created_at=datetime.utcnow()
+    )
+    db.add(db_estimate)
+    db.commit()
+    return db_estimate
+
+def compute_estimate(request: schemas.EstimateRequest, snapshot):
+    """Compute an estimate from a pricing snapshot (pure CPU, no database access)"""
     
     # Get project template
     template = PROJECT_TEMPLATES.get(request.project_type)
@@ -61,9 +149,7 @@ def generate_estimate(request: schemas.EstimateRequest, db: Session):
     
     for material_key, quantity_func in template.items():
         # Get material
-        material = db.query(models.Material).filter(
-            models.Material.mapping_key == material_key
-        ).first()
+        material = snapshot.get(material_key)
         
         if not material:
             continue
@@ -71,24 +157,10 @@ def generate_estimate(request: schemas.EstimateRequest, db: Session):
         # Calculate quantity
         quantity = quantity_func(request.size)
         
-        # Get base price
-        latest_price = db.query(models.PriceIndex).filter(
-            models.PriceIndex.material_id == material.id,
-            models.PriceIndex.region == "Greece"
-        ).order_by(models.PriceIndex.date.desc()).first()
-        
-        if not latest_price:
-            continue
-            
-        base_price = latest_price.unit_price
+        base_price = material["base_price"]
         
         # Apply seasonal factor
-        seasonal_factor = db.query(models.Seasonality).filter(
-            models.Seasonality.material_id == material.id,
-            models.Seasonality.month == request.start_month
-        ).first()
-        
-        seasonal_multiplier = seasonal_factor.factor if seasonal_factor else 1.0
+        seasonal_multiplier = material["seasonality"].get(request.start_month, 1.0)
         
         # Apply location factor (simplified)
         location_factor = 1.0
@@ -111,9 +183,9 @@ def generate_estimate(request: schemas.EstimateRequest, db: Session):
         
         # Create BoQ item as dict
         boq_item = {
-            "material_name": material.name,
+            "material_name": material["name"],
             "quantity": round(quantity, 2),
-            "unit": material.unit,
+            "unit": material["unit"],
             "unit_price": round(unit_price, 2),
             "total_price": round(total_price, 2),
             "seasonal_factor": round(seasonal_multiplier, 3),
@@ -122,41 +194,32 @@ def generate_estimate(request: schemas.EstimateRequest, db: Session):
         boq_items.append(boq_item)
         
         # Get vendor recommendations
-        vendors = db.query(models.VendorOffer).filter(
-            models.VendorOffer.material_id == material.id
-        ).join(models.Vendor).order_by(models.VendorOffer.unit_price).limit(3).all()
-        
         vendor_recs = []
-        for vendor_offer in vendors:
-            stock_status = "In Stock" if vendor_offer.stock_qty >= quantity else "Limited Stock"
-            if vendor_offer.stock_qty == 0:
+        for offer in material["offers"]:
+            stock_status = "In Stock" if offer["stock_qty"] >= quantity else "Limited Stock"
+            if offer["stock_qty"] == 0:
                 stock_status = "Out of Stock"
                 
             vendor_rec = {
-                "vendor_name": vendor_offer.vendor.name,
-                "location": vendor_offer.vendor.region,
-                "price": vendor_offer.unit_price,
+                "vendor_name": offer["vendor_name"],
+                "location": offer["location"],
+                "price": offer["price"],
                 "stock_status": stock_status,
-                "lead_time_days": vendor_offer.lead_time_days,
-                "moq": vendor_offer.moq,
-                "contact": vendor_offer.vendor.contacts.get("email", "N/A")
+                "lead_time_days": offer["lead_time_days"],
+                "moq": offer["moq"],
+                "contact": offer["contact"]
             }
             vendor_recs.append(vendor_rec)
         
-        vendor_recommendations[material.name] = vendor_recs
+        vendor_recommendations[material["name"]] = vendor_recs
         
         # Generate seasonal chart data
         seasonal_data = []
         for month in range(1, 13):
-            seasonal_factor_month = db.query(models.Seasonality).filter(
-                models.Seasonality.material_id == material.id,
-                models.Seasonality.month == month
-            ).first()
-            
-            factor = seasonal_factor_month.factor if seasonal_factor_month else 1.0
+            factor = material["seasonality"].get(month, 1.0)
             seasonal_data.append({
                 "month": month,
-                "material": material.name,
+                "material": material["name"],
                 "price_factor": factor,
                 "price": base_price * factor
             })
@@ -166,7 +229,7 @@ def generate_estimate(request: schemas.EstimateRequest, db: Session):
         # Add to cost drivers if significant
         if total_price > total_cost * 0.1:  # More than 10% of total cost
             cost_drivers.append({
-                "material": material.name,
+                "material": material["name"],
                 "cost": total_price,
                 "percentage": (total_price / total_cost) * 100
             })
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -20,6 +20,13 @@ class EstimateRequest(BaseModel):
     earthworks_volume: Optional[float] = None
     preferred_vendors: Optional[List[str]] = None
 
+class SweepRequest(BaseModel):
+    base: EstimateRequest
+    sizes: Optional[List[float]] = None  # defaults to base.size
+    start_months: Optional[List[int]] = None  # defaults to base.start_month
+    locations: Optional[List[str]] = None  # defaults to base.location
+    workers: Optional[int] = Field(None, ge=1)  # capped at CPU count
+
 class BoQItem(BaseModel):
     material_name: str
     quantity: float
@@ -65,5 +72,20 @@ class VendorResponse(BaseModel):
     contacts: Dict[str, Any]
     reliability_score: float
     
+    class Config:
+        from_attributes = True
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str
+    priority: int
+    progress: float
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -0,0 +1,201 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import pricing_engine
+import schemas
+
+MAX_GRID_POINTS = 20000
+MAX_WORKERS = os.cpu_count() or 1
+CHUNKS_PER_WORKER = 4  # Enough chunks to balance load without per-point IPC
+
+# Pricing snapshot of the current worker process, set once by _init_worker
+_snapshot = None
+
+def _init_worker(snapshot):
+    """Install the read-only pricing snapshot in a worker process.
+
+    Passed as initargs, so it is sent once per worker process, never once per task.
+    """
+    global _snapshot
+    _snapshot = snapshot
+
+def _run_chunk(base, points):
+    """Evaluate a chunk of grid points against the worker's snapshot"""
+    results = []
+    for index, size, start_month, location in points:
+        request = schemas.EstimateRequest(**{
+            **base,
+            "size": size,
+            "start_month": start_month,
+            "location": location
+        })
+        estimate = pricing_engine.compute_estimate(request, _snapshot)
+        results.append({
+            "index": index,
+            "size": size,
+            "start_month": start_month,
+            "location": location,
+            "total_cost": estimate["total_cost"],
+            "confidence_bands": estimate["confidence_bands"]
+        })
+    return results
+
+def build_grid(sweep: schemas.SweepRequest):
+    """Expand size x start_month x location into indexed grid points"""
+    base = sweep.base
+    if base.project_type not in pricing_engine.PROJECT_TEMPLATES:
+        raise ValueError(f"Unknown project type: {base.project_type}")
+
+    sizes = sweep.sizes or [base.size]
+    start_months = sweep.start_months or [base.start_month]
+    locations = sweep.locations or [base.location]
+
+    invalid_months = [m for m in start_months if not 1 <= m <= 12]
+    if invalid_months:
+        raise ValueError(f"Invalid start months: {invalid_months}")
+
+    grid_size = len(sizes) * len(start_months) * len(locations)
+    if grid_size > MAX_GRID_POINTS:
+        raise ValueError(f"Sweep has {grid_size} points, maximum is {MAX_GRID_POINTS}")
+
+    return [
+        (index, size, start_month, location)
+        for index, (size, start_month, location)
+        in enumerate(itertools.product(sizes, start_months, locations))
+    ]
+
+def _mp_context():
+    # Never fork the multi-threaded server process; forkserver workers start
+    # from a clean process with this module already imported
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["sweep"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+class _SnapshotPool:
+    """Process pool whose workers hold one version of the pricing snapshot"""
+
+    def __init__(self, version, snapshot):
+        self.version = version
+        self.executor = ProcessPoolExecutor(
+            max_workers=MAX_WORKERS,
+            mp_context=_mp_context(),
+            initializer=_init_worker,
+            initargs=(snapshot,)
+        )
+        self.active = 0
+        self.retired = False
+
+    def retire(self):
+        self.retired = True
+        if self.active == 0:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+# Shared by all sweeps; replaced when the snapshot changes. Only touched from
+# the event loop thread, so no locking is needed.
+_pool = None
+
+def _snapshot_version(snapshot):
+    return hashlib.sha1(json.dumps(snapshot, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _acquire_pool(snapshot):
+    global _pool
+    version = _snapshot_version(snapshot)
+    if _pool is None or _pool.retired or _pool.version != version:
+        # Sweeps still running on the old pool keep it alive until they release it
+        if _pool is not None and not _pool.retired:
+            _pool.retire()
+        _pool = _SnapshotPool(version, snapshot)
+    _pool.active += 1
+    return _pool
+
+def _release_pool(pool):
+    pool.active -= 1
+    if pool.retired and pool.active == 0:
+        pool.executor.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_pool():
+    """Stop the shared worker pool (called on application shutdown)"""
+    global _pool
+    if _pool is not None:
+        _pool.retire()
+        _pool = None
+
+def _error_lines(chunk, error):
+    return [
+        json.dumps({
+            "index": index,
+            "size": size,
+            "start_month": start_month,
+            "location": location,
+            "error": error
+        }) + "\n"
+        for index, size, start_month, location in chunk
+    ]
+
+async def stream_sweep(sweep: schemas.SweepRequest, grid, snapshot):
+    """Evaluate the grid on the shared process pool, yielding NDJSON lines as chunks complete.
+
+    At most `workers` chunks of this sweep are in flight at once. A failed chunk
+    yields one line per grid point with an "error" field instead of results.
+    """
+    workers = max(1, min(sweep.workers or MAX_WORKERS, MAX_WORKERS, len(grid)))
+    chunk_size = math.ceil(len(grid) / (workers * CHUNKS_PER_WORKER))
+    chunks = iter([grid[i:i + chunk_size] for i in range(0, len(grid), chunk_size)])
+    base = sweep.base.dict()
+
+    pool = _acquire_pool(snapshot)
+    pending = {}
+
+    def submit_next():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        try:
+            future = asyncio.wrap_future(pool.executor.submit(_run_chunk, base, chunk))
+        except BrokenProcessPool as e:
+            # The pool broke while other chunks were completing; route the failure
+            # through the result handling below so every point still gets a line
+            future = asyncio.get_running_loop().create_future()
+            future.set_exception(e)
+        pending[future] = chunk
+
+    try:
+        for _ in range(workers):
+            submit_next()
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                chunk = pending.pop(future)
+                try:
+                    results = future.result()
+                except BrokenProcessPool as e:
+                    # A worker died; fail everything left and let the next sweep start a new pool
+                    if not pool.retired:
+                        pool.retire()
+                    for line in _error_lines(chunk, f"Worker pool failed: {e}"):
+                        yield line
+                    for remaining in itertools.chain(pending.values(), chunks):
+                        for line in _error_lines(remaining, f"Worker pool failed: {e}"):
+                            yield line
+                    return
+                except Exception as e:
+                    for line in _error_lines(chunk, str(e)):
+                        yield line
+                else:
+                    for result in results:
+                        yield json.dumps(result) + "\n"
+                submit_next()
+    finally:
+        # Client disconnects land here too; drop chunks that have not started
+        for future in pending:
+            future.cancel()
+        _release_pool(pool)